@@ -25,6 +25,9 @@ pip install -r requirements.txt
 Write-Host "Generating synthetic event data..."
 python .\src\launchlens\data\generate_events.py --out_dir data --n_users 8000 --n_days 28 --experiment_start_day 14 --purchase_lift_mult 1.15
 
+# Pipeline modules import the launchlens package
+$env:PYTHONPATH = "src"
+
 # Build warehouse
 Write-Host "Building warehouse tables..."
 python .\src\launchlens\warehouse\build_warehouse.py --db data\launchlens.duckdb
@@ -35,5 +38,4 @@ python .\src\launchlens\experimentation\ab_readout.py --db data\launchlens.duckd
 
 # Launch Streamlit
 Write-Host "Launching dashboard..."
-$env:PYTHONPATH = "src"
 streamlit run .\src\launchlens\dashboards\app.py
@@ -1,15 +1,14 @@
 import os
-import duckdb
 import pandas as pd
 import streamlit as st
 from pathlib import Path
-import subprocess
-import sys
 
 
 
 
-from launchlens.experimentation.ab_readout import run_readout
+from launchlens.experimentation.ab_readout import format_readout, run_readout
+from launchlens.experimentation.generate_report import generate_report
+from launchlens.utils.db import connect
 
 st.set_page_config(page_title="LaunchLens", layout="wide")
 
@@ -23,6 +22,7 @@ st.caption("Product metrics + A/B readouts + SRM/guardrails (synthetic demo)")
 st.sidebar.header("Controls")
 db_path = st.sidebar.text_input("DuckDB path", DB_PATH)
 experiment_id = st.sidebar.text_input("Experiment ID", EXPERIMENT_ID)
+experiment_period_only = st.sidebar.checkbox("Trends: experiment period only", value=False)
 st.sidebar.divider()
 st.sidebar.subheader("Report")
 
@@ -31,19 +31,7 @@ report_filename = f"{experiment_id}_report.md"
 report_path = Path(report_out_dir) / report_filename
 
 if st.sidebar.button("Generate report (.md)"):
-    Path(report_out_dir).mkdir(parents=True, exist_ok=True)
-    # call the report generator using the same python env
-    env = dict(**os.environ)
-    env["PYTHONPATH"] = "src"
-    subprocess.run(
-        [sys.executable, "src/launchlens/experimentation/generate_report.py",
-
-         "--db", db_path,
-         "--experiment_id", experiment_id,
-         "--out_dir", report_out_dir],
-        check=True,
-        env=env,
-    )
+    report_path = generate_report(db_path, experiment_id, report_out_dir)
     st.sidebar.success(f"Generated: {report_path}")
 
 if report_path.exists():
@@ -57,40 +45,101 @@ else:
     st.sidebar.caption("Generate the report to enable download.")
 
 
-con = duckdb.connect(db_path)
-
-# --- SRM (user-level + session-level) ---
-users = con.execute(
-    """
-    SELECT variant, COUNT(*) AS n_users
-    FROM users
-    WHERE experiment_id = ?
-    GROUP BY 1
-    """,
-    [experiment_id],
-).fetchdf()
-
-sessions = con.execute(
-    """
-    SELECT variant, COUNT(*) AS n_sessions
-    FROM fact_sessions
-    WHERE experiment_id = ?
-      AND is_experiment_period = TRUE
-    GROUP BY 1
-    """,
-    [experiment_id],
-).fetchdf()
-
-def get_count(df: pd.DataFrame, col: str, label: str) -> int:
-    sub = df[df["variant"] == label]
-    if sub.empty:
-        return 0
-    return int(sub[col].iloc[0])
-
-u_c = get_count(users, "n_users", "control")
-u_t = get_count(users, "n_users", "treatment")
-s_c = get_count(sessions, "n_sessions", "control")
-s_t = get_count(sessions, "n_sessions", "treatment")
+# --- Data loading (cached across Streamlit reruns) ---
+# db_mtime is part of the cache key only, so rebuilding the warehouse invalidates results.
+@st.cache_data(show_spinner=False)
+def load_experiment_data(db_path: str, experiment_id: str, db_mtime: float):
+    # One read-only connection shared by every query below (including the readout)
+    con = connect(db_path)
+    try:
+        # SRM counts + guardrails (experiment period) in a single round-trip
+        summary = con.execute(
+            """
+            WITH u AS (
+              SELECT variant, COUNT(*) AS n_users
+              FROM users
+              WHERE experiment_id = ?
+              GROUP BY 1
+            ),
+            s AS (
+              SELECT
+                variant,
+                COUNT(*) AS sessions,
+                AVG(has_click)::DOUBLE AS click_rate,
+                AVG(has_add_to_cart)::DOUBLE AS atc_rate_per_session,
+                AVG(has_purchase)::DOUBLE AS purchase_rate_per_session,
+                AVG(revenue)::DOUBLE AS revenue_per_session,
+                (SUM(has_click)::DOUBLE / NULLIF(SUM(has_impression), 0)) AS ctr,
+                (SUM(has_add_to_cart)::DOUBLE / NULLIF(SUM(has_click), 0)) AS atc_rate_given_click
+              FROM fact_sessions
+              WHERE experiment_id = ?
+                AND is_experiment_period = TRUE
+              GROUP BY 1
+            )
+            SELECT
+              variant,
+              COALESCE(u.n_users, 0) AS n_users,
+              COALESCE(s.sessions, 0) AS sessions,
+              s.click_rate,
+              s.atc_rate_per_session,
+              s.purchase_rate_per_session,
+              s.revenue_per_session,
+              s.ctr,
+              s.atc_rate_given_click
+            FROM u
+            FULL JOIN s USING (variant)
+            ORDER BY 1
+            """,
+            [experiment_id, experiment_id],
+        ).fetchdf()
+
+        # A/B readout
+        readout = run_readout(db_path, experiment_id, con=con)
+    finally:
+        con.close()
+    return summary, readout
+
+
+# Daily trends, cached per experiment_period_only setting
+@st.cache_data(show_spinner=False)
+def load_daily_trends(db_path: str, experiment_id: str, experiment_period_only: bool, db_mtime: float):
+    con = connect(db_path)
+    try:
+        # Daily trends: only the plotted columns
+        daily = con.execute(
+            """
+            SELECT
+              CAST(event_date AS TIMESTAMP) AS event_date,
+              variant,
+              purchase_rate_per_session,
+              revenue_per_session,
+              ctr,
+              atc_rate
+            FROM daily_metrics
+            WHERE grain = 'day'
+              AND experiment_id = ?
+              AND (NOT ? OR is_experiment_period = 1)
+            ORDER BY event_date, variant
+            """,
+            [experiment_id, experiment_period_only],
+        ).to_arrow_table().to_pandas(types_mapper=pd.ArrowDtype)
+    finally:
+        con.close()
+    return daily
+
+
+db_mtime = os.path.getmtime(db_path)
+summary, readout = load_experiment_data(db_path, experiment_id, db_mtime)
+daily = load_daily_trends(db_path, experiment_id, experiment_period_only, db_mtime)
+
+# variant -> count lookups (summary has one row per variant)
+counts_u = dict(zip(summary["variant"], summary["n_users"].astype(int).tolist()))
+counts_s = dict(zip(summary["variant"], summary["sessions"].astype(int).tolist()))
+
+u_c = counts_u.get("control", 0)
+u_t = counts_u.get("treatment", 0)
+s_c = counts_s.get("control", 0)
+s_t = counts_s.get("treatment", 0)
 
 # Simple SRM p-value via chi-square against 50/50
 import numpy as np
@@ -107,40 +156,15 @@ chi_u, p_u = srm_pval(u_c, u_t, 0.5)
 chi_s, p_s = srm_pval(s_c, s_t, 0.5)
 
 # --- Guardrails ---
-guard = con.execute(
-    """
-    SELECT
-      variant,
-      COUNT(*) AS sessions,
-      AVG(has_click)::DOUBLE AS click_rate,
-      AVG(has_add_to_cart)::DOUBLE AS atc_rate_per_session,
-      AVG(has_purchase)::DOUBLE AS purchase_rate_per_session,
-      AVG(revenue)::DOUBLE AS revenue_per_session,
-      (SUM(has_click)::DOUBLE / NULLIF(SUM(has_impression), 0)) AS ctr,
-      (SUM(has_add_to_cart)::DOUBLE / NULLIF(SUM(has_click), 0)) AS atc_rate_given_click
-    FROM fact_sessions
-    WHERE experiment_id = ?
-      AND is_experiment_period = TRUE
-    GROUP BY 1
-    ORDER BY 1
-    """,
-    [experiment_id],
-).fetchdf()
-
-con.close()
-
-# --- A/B Readout ---
-readout = run_readout(db_path, experiment_id)
+guard = summary[summary["sessions"] > 0].drop(columns="n_users").reset_index(drop=True)
 
 # Decision logic (simple demo): ship if purchase_rate_per_session p<0.05 and abs_diff>0
+# readout is numeric; readout_display holds the formatted strings for rendering
+readout_display = format_readout(readout)
 primary = readout[readout["metric"] == "purchase_rate_per_session"].iloc[0]
-pval_primary = float(primary["p_value"])
-abs_diff_primary = primary["abs_diff"]
-
-# abs_diff_primary is a string like "0.132%" in our formatted output
-abs_diff_num = float(abs_diff_primary.replace("%", "")) / 100.0
+primary_display = readout_display[readout_display["metric"] == "purchase_rate_per_session"].iloc[0]
 
-ship = (pval_primary < 0.05) and (abs_diff_num > 0)
+ship = (float(primary["p_value"]) < 0.05) and (float(primary["abs_diff"]) > 0)
 
 # --- Layout ---
 col1, col2, col3 = st.columns(3)
@@ -152,7 +176,7 @@ with col1:
     else:
         st.warning("Hold / Continue Experiment ⚠️")
     st.write("Primary metric:", "purchase_rate_per_session")
-    st.write("Δ (T-C):", primary["abs_diff"], " | p-value:", primary["p_value"])
+    st.write("Δ (T-C):", primary_display["abs_diff"], " | p-value:", primary_display["p_value"])
     st.caption("Decision rule (demo): ship if p<0.05 and lift>0")
 
 with col2:
@@ -173,60 +197,40 @@ st.divider()
 
 st.subheader("Trends (Daily)")
 
-con = duckdb.connect(db_path)
-daily = con.execute(
-    """
-    SELECT
-      event_date,
-      variant,
-      is_experiment_period,
-      sessions,
-      purchase_rate_per_session,
-      revenue_per_session,
-      ctr,
-      atc_rate
-    FROM daily_metrics
-    WHERE experiment_id = ?
-    ORDER BY event_date, variant
-    """,
-    [experiment_id],
-).fetchdf()
-con.close()
-
-daily["event_date"] = pd.to_datetime(daily["event_date"])
+daily["variant"] = daily["variant"].astype("category")
+
+# grain = 'day' rows are one per (event_date, variant), so a plain pivot works
+trend_cols = ["purchase_rate_per_session", "revenue_per_session", "ctr", "atc_rate"]
+pivoted = daily.pivot(index="event_date", columns="variant", values=trend_cols)
 
 cA, cB = st.columns(2)
 
 with cA:
     st.caption("Purchase rate per session (daily)")
-    chart_df = daily.pivot_table(index="event_date", columns="variant", values="purchase_rate_per_session")
-    st.line_chart(chart_df)
+    st.line_chart(pivoted["purchase_rate_per_session"])
 
 with cB:
     st.caption("Revenue per session (daily)")
-    chart_df = daily.pivot_table(index="event_date", columns="variant", values="revenue_per_session")
-    st.line_chart(chart_df)
+    st.line_chart(pivoted["revenue_per_session"])
 
 cC, cD = st.columns(2)
 
 with cC:
     st.caption("CTR (daily)")
-    chart_df = daily.pivot_table(index="event_date", columns="variant", values="ctr")
-    st.line_chart(chart_df)
+    st.line_chart(pivoted["ctr"])
 
 with cD:
     st.caption("ATC rate (daily)")
-    chart_df = daily.pivot_table(index="event_date", columns="variant", values="atc_rate")
-    st.line_chart(chart_df)
+    st.line_chart(pivoted["atc_rate"])
 
-st.caption("Tip: Pre-period vs experiment period is encoded in is_experiment_period for diagnostics.")
+st.caption("Tip: Keep the pre-period in the trends (sidebar toggle) to check variant parity before launch.")
 
 
 c1, c2 = st.columns([1.4, 1.0])
 
 with c1:
     st.subheader("A/B Readout (Experiment Period)")
-    st.dataframe(readout, use_container_width=True)
+    st.dataframe(readout_display, use_container_width=True)
 
 with c2:
     st.subheader("Guardrails")
@@ -8,7 +8,7 @@ Outputs a decision-ready table for experiment period:
 - atc_rate
 - purchase_rate_given_atc
 
-Uses session-level data to compute:
+Uses per-variant session aggregates to compute:
 - Control mean, Treatment mean
 - Absolute diff, Relative diff
 - 95% CI and p-value (two-sided)
@@ -19,12 +19,19 @@ from __future__ import annotations
 import argparse
 import math
 from dataclasses import dataclass
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
 
 import duckdb
 import numpy as np
 import pandas as pd
-from scipy import stats
+from scipy.special import erfc, ndtri, stdtr, stdtrit
+
+from launchlens.utils.db import connect
+
+# two-sided 95% normal critical value, computed once at import
+_Z_975 = float(ndtri(0.975))
+
+_PCT_METRICS = {"purchase_rate_per_session", "ctr", "atc_rate", "purchase_rate_given_atc"}
 
 
 @dataclass
@@ -39,51 +46,53 @@ class MetricResult:
     p_value: float
 
 
-def _two_proportion_ztest(x1: int, n1: int, x2: int, n2: int) -> Tuple[float, float, float, float]:
+def _two_proportion_ztest(
+    x1: np.ndarray, n1: np.ndarray, x2: np.ndarray, n2: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
     """
-    Returns: (p1, p2, diff, (ci_low, ci_high), p_value) but CI returned separately in main.
+    Vectorized over metrics: each argument holds one (successes, trials) entry per metric.
+    Returns arrays (p1, p2, diff, ci_low, ci_high, p_value); empty denominators give zeros and p=1.
     """
-    if n1 == 0 or n2 == 0:
-        return 0.0, 0.0, 0.0, (0.0, 0.0), 1.0
-
-    p1 = x1 / n1
-    p2 = x2 / n2
-    diff = p2 - p1
-
-    # Standard error for difference in proportions (unpooled for CI)
-    se_ci = math.sqrt((p1 * (1 - p1) / n1) + (p2 * (1 - p2) / n2))
-    z = stats.norm.ppf(0.975)
-    ci_low, ci_high = diff - z * se_ci, diff + z * se_ci
-
-    # P-value using pooled SE for z-test
-    p_pool = (x1 + x2) / (n1 + n2)
-    se_pooled = math.sqrt(p_pool * (1 - p_pool) * (1 / n1 + 1 / n2))
-    if se_pooled == 0:
-        p_value = 1.0
-    else:
-        z_stat = diff / se_pooled
-        p_value = 2 * (1 - stats.norm.cdf(abs(z_stat)))
-
-    return p1, p2, diff, (ci_low, ci_high), p_value
-
-
-def _two_sample_ttest(a: np.ndarray, b: np.ndarray) -> Tuple[float, float, float]:
+    x1 = np.asarray(x1, dtype=float)
+    n1 = np.asarray(n1, dtype=float)
+    x2 = np.asarray(x2, dtype=float)
+    n2 = np.asarray(n2, dtype=float)
+    valid = (n1 > 0) & (n2 > 0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p1 = np.where(valid, x1 / n1, 0.0)
+        p2 = np.where(valid, x2 / n2, 0.0)
+        diff = p2 - p1
+
+        # Standard error for difference in proportions (unpooled for CI)
+        se_ci = np.where(valid, np.sqrt(p1 * (1 - p1) / n1 + p2 * (1 - p2) / n2), 0.0)
+        ci_low, ci_high = diff - _Z_975 * se_ci, diff + _Z_975 * se_ci
+
+        # P-value using pooled SE for z-test
+        p_pool = (x1 + x2) / (n1 + n2)
+        se_pooled = np.sqrt(p_pool * (1 - p_pool) * (1 / n1 + 1 / n2))
+        testable = valid & (se_pooled > 0)
+        z_stat = np.where(testable, diff / se_pooled, 0.0)
+        p_value = np.where(testable, erfc(np.abs(z_stat) / np.sqrt(2.0)), 1.0)
+
+    return p1, p2, diff, ci_low, ci_high, p_value
+
+
+def _two_sample_ttest(
+    mean_a: float, var_a: float, n_a: int, mean_b: float, var_b: float, n_b: int
+) -> Tuple[float, float, float]:
     """
-    Welch's t-test + CI for mean difference (b - a).
+    Welch's t-test + CI for mean difference (b - a), from per-group moments.
     Returns (diff, (ci_low, ci_high), p_value)
     """
-    a = a.astype(float)
-    b = b.astype(float)
-    if len(a) < 2 or len(b) < 2:
+    if n_a < 2 or n_b < 2:
         return 0.0, (0.0, 0.0), 1.0
 
-    diff = float(np.mean(b) - np.mean(a))
-    tstat, p_value = stats.ttest_ind(b, a, equal_var=False, nan_policy="omit")
+    diff = float(mean_b - mean_a)
 
     # Welch-Satterthwaite df
-    va = np.var(a, ddof=1)
-    vb = np.var(b, ddof=1)
-    na, nb = len(a), len(b)
+    va, vb = float(var_a), float(var_b)
+    na, nb = int(n_a), int(n_b)
     se = math.sqrt(va / na + vb / nb)
     if se == 0:
         return diff, (diff, diff), 1.0
@@ -92,164 +101,121 @@ def _two_sample_ttest(a: np.ndarray, b: np.ndarray) -> Tuple[float, float, float
     df_den = (va**2) / (na**2 * (na - 1)) + (vb**2) / (nb**2 * (nb - 1))
     df = df_num / df_den if df_den > 0 else (na + nb - 2)
 
-    tcrit = stats.t.ppf(0.975, df)
+    # two-sided p-value straight from the Student-t CDF
+    p_value = 2 * stdtr(df, -abs(diff / se))
+
+    tcrit = stdtrit(df, 0.975)
     ci_low, ci_high = diff - tcrit * se, diff + tcrit * se
     return diff, (ci_low, ci_high), float(p_value)
 
 
-def run_readout(db_path: str, experiment_id: str) -> pd.DataFrame:
-    con = duckdb.connect(db_path)
-
-    # session-level experiment-period data
-    df = con.execute(
-        """
-        SELECT
-          variant,
-          has_impression,
-          has_click,
-          has_add_to_cart,
-          has_purchase,
-          revenue
-        FROM fact_sessions
-        WHERE experiment_id = ?
-          AND is_experiment_period = TRUE
-        """,
-        [experiment_id],
-    ).fetchdf()
-    con.close()
-
-    if df.empty:
+def run_readout(
+    db_path: str, experiment_id: str, con: Optional[duckdb.DuckDBPyConnection] = None
+) -> pd.DataFrame:
+    """
+    Numeric readout, one row per metric (fractions, not percents).
+    Use format_readout() to render it for display.
+    """
+    # reuse the caller's connection if given; otherwise open (and close) our own
+    own_con = con is None
+    if own_con:
+        con = connect(db_path)
+
+    try:
+        # per-variant experiment-period aggregates (one row per variant)
+        rows = con.execute(
+            """
+            SELECT
+              variant,
+              COUNT(*) AS n,
+              SUM(has_impression) AS imp,
+              SUM(has_click) AS clk,
+              SUM(has_add_to_cart) AS atc,
+              SUM(has_purchase) AS pur,
+              AVG(revenue) AS rev_mean,
+              COALESCE(VAR_SAMP(revenue), 0.0) AS rev_var
+            FROM fact_sessions
+            WHERE experiment_id = ?
+              AND is_experiment_period = TRUE
+            GROUP BY 1
+            """,
+            [experiment_id],
+        ).fetchall()
+    finally:
+        if own_con:
+            con.close()
+
+    if not rows:
         raise ValueError("No experiment-period sessions found. Check experiment_id or data.")
 
-    out: Dict[str, MetricResult] = {}
+    agg = {r[0]: r[1:] for r in rows}
+    empty = (0, 0, 0, 0, 0, 0.0, 0.0)
 
-    # Split
-    c = df[df["variant"] == "control"]
-    t = df[df["variant"] == "treatment"]
-
-    n_c = len(c)
-    n_t = len(t)
-
-    # 1) purchase_rate_per_session (proportion)
-    x_c = int(c["has_purchase"].sum())
-    x_t = int(t["has_purchase"].sum())
-    p1, p2, diff, (ci_low, ci_high), pval = _two_proportion_ztest(x_c, n_c, x_t, n_t)
-    out["purchase_rate_per_session"] = MetricResult(
-        metric="purchase_rate_per_session",
-        control=p1,
-        treatment=p2,
-        abs_diff=diff,
-        rel_diff=(diff / p1) if p1 > 0 else np.nan,
-        ci_low=ci_low,
-        ci_high=ci_high,
-        p_value=pval,
-    )
+    out: Dict[str, MetricResult] = {}
 
-    # 2) ctr = click/impression (use impression sessions as denom)
-    imp_c = int(c["has_impression"].sum())
-    imp_t = int(t["has_impression"].sum())
-    clk_c = int(c["has_click"].sum())
-    clk_t = int(t["has_click"].sum())
-    p1, p2, diff, (ci_low, ci_high), pval = _two_proportion_ztest(clk_c, imp_c, clk_t, imp_t)
-    out["ctr"] = MetricResult(
-        metric="ctr",
-        control=p1,
-        treatment=p2,
-        abs_diff=diff,
-        rel_diff=(diff / p1) if p1 > 0 else np.nan,
-        ci_low=ci_low,
-        ci_high=ci_high,
-        p_value=pval,
-    )
+    # Per-variant aggregates
+    n_c, imp_c, clk_c, atc_c, x_c, rev_mean_c, rev_var_c = agg.get("control", empty)
+    n_t, imp_t, clk_t, atc_t, x_t, rev_mean_t, rev_var_t = agg.get("treatment", empty)
 
+    # Proportion metrics, tested in one vectorized pass: (numerator, denominator) per variant
+    # 1) purchase_rate_per_session = purchase / session
+    # 2) ctr = click / impression (impression sessions denom)
     # 3) atc_rate = add_to_cart / click (click sessions denom)
-    atc_c = int(c["has_add_to_cart"].sum())
-    atc_t = int(t["has_add_to_cart"].sum())
-    p1, p2, diff, (ci_low, ci_high), pval = _two_proportion_ztest(atc_c, clk_c, atc_t, clk_t)
-    out["atc_rate"] = MetricResult(
-        metric="atc_rate",
-        control=p1,
-        treatment=p2,
-        abs_diff=diff,
-        rel_diff=(diff / p1) if p1 > 0 else np.nan,
-        ci_low=ci_low,
-        ci_high=ci_high,
-        p_value=pval,
-    )
-
     # 4) purchase_rate_given_atc = purchase / atc (atc denom)
-    p1, p2, diff, (ci_low, ci_high), pval = _two_proportion_ztest(x_c, atc_c, x_t, atc_t)
-    out["purchase_rate_given_atc"] = MetricResult(
-        metric="purchase_rate_given_atc",
-        control=p1,
-        treatment=p2,
-        abs_diff=diff,
-        rel_diff=(diff / p1) if p1 > 0 else np.nan,
-        ci_low=ci_low,
-        ci_high=ci_high,
-        p_value=pval,
+    prop_metrics = ["purchase_rate_per_session", "ctr", "atc_rate", "purchase_rate_given_atc"]
+    p1, p2, diff, ci_low, ci_high, pval = _two_proportion_ztest(
+        [x_c, clk_c, atc_c, x_c],
+        [n_c, imp_c, clk_c, atc_c],
+        [x_t, clk_t, atc_t, x_t],
+        [n_t, imp_t, clk_t, atc_t],
     )
-
-    # 5) revenue_per_session (continuous)
-    diff, (ci_low, ci_high), pval = _two_sample_ttest(c["revenue"].to_numpy(), t["revenue"].to_numpy())
+    for i, m in enumerate(prop_metrics):
+        out[m] = MetricResult(
+            metric=m,
+            control=float(p1[i]),
+            treatment=float(p2[i]),
+            abs_diff=float(diff[i]),
+            rel_diff=float(diff[i] / p1[i]) if p1[i] > 0 else np.nan,
+            ci_low=float(ci_low[i]),
+            ci_high=float(ci_high[i]),
+            p_value=float(pval[i]),
+        )
+
+    # 5) revenue_per_session (continuous, Welch from DuckDB-side mean/var)
+    diff, (ci_low, ci_high), pval = _two_sample_ttest(rev_mean_c, rev_var_c, n_c, rev_mean_t, rev_var_t, n_t)
     out["revenue_per_session"] = MetricResult(
         metric="revenue_per_session",
-        control=float(np.mean(c["revenue"])),
-        treatment=float(np.mean(t["revenue"])),
+        control=rev_mean_c,
+        treatment=rev_mean_t,
         abs_diff=diff,
-        rel_diff=(diff / float(np.mean(c["revenue"]))) if float(np.mean(c["revenue"])) > 0 else np.nan,
+        rel_diff=(diff / rev_mean_c) if rev_mean_c > 0 else np.nan,
         ci_low=ci_low,
         ci_high=ci_high,
         p_value=pval,
     )
 
     res = pd.DataFrame([vars(v) for v in out.values()])
+    return res.sort_values("metric").reset_index(drop=True)
 
-    # formatting helpers
-    def fmt_pct(x):
-        return f"{x*100:.3f}%" if pd.notnull(x) else "NA"
-
-    def fmt_num(x):
-        return f"{x:.4f}" if pd.notnull(x) else "NA"
-
-    def fmt_money(x):
-        return f"{x:.4f}" if pd.notnull(x) else "NA"
-
-    # Presentable table
-        # ---------- Build formatted output table (strings only) ----------
-    out_rows = []
-    for _, r in res.iterrows():
-        m = r["metric"]
-
-        def pct(x): return f"{float(x)*100:.3f}%"
-        def rel(x): return f"{float(x)*100:.2f}%"
-        def num(x): return f"{float(x):.4f}"
-
-        row = {"metric": m}
-
-        if m in {"purchase_rate_per_session", "ctr", "atc_rate", "purchase_rate_given_atc"}:
-            row["control"] = pct(r["control"])
-            row["treatment"] = pct(r["treatment"])
-            row["abs_diff"] = pct(r["abs_diff"])
-            row["rel_diff"] = rel(r["rel_diff"]) if pd.notnull(r["rel_diff"]) else "NA"
-            row["ci_low"] = pct(r["ci_low"])
-            row["ci_high"] = pct(r["ci_high"])
-            row["p_value"] = num(r["p_value"])
-        else:  # revenue_per_session
-            row["control"] = num(r["control"])
-            row["treatment"] = num(r["treatment"])
-            row["abs_diff"] = num(r["abs_diff"])
-            row["rel_diff"] = rel(r["rel_diff"]) if pd.notnull(r["rel_diff"]) else "NA"
-            row["ci_low"] = num(r["ci_low"])
-            row["ci_high"] = num(r["ci_high"])
-            row["p_value"] = num(r["p_value"])
-
-        out_rows.append(row)
-
-    display = pd.DataFrame(out_rows)
-    display = display[["metric", "control", "treatment", "abs_diff", "rel_diff", "ci_low", "ci_high", "p_value"]]
-    return display.sort_values("metric").reset_index(drop=True)
 
+def format_readout(res: pd.DataFrame) -> pd.DataFrame:
+    """
+    Render the numeric readout from run_readout as a presentable table (strings only).
+    """
+    # proportion metrics render as percents; revenue_per_session as a plain number
+    is_pct = res["metric"].isin(_PCT_METRICS).to_numpy()
+
+    display = pd.DataFrame({"metric": res["metric"]})
+    for col in ["control", "treatment", "abs_diff", "rel_diff", "ci_low", "ci_high", "p_value"]:
+        v = res[col]
+        if col == "rel_diff":
+            display[col] = (v * 100).map("{:.2f}%".format).where(v.notna(), "NA")
+        elif col == "p_value":
+            display[col] = v.map("{:.4f}".format)
+        else:
+            display[col] = np.where(is_pct, (v * 100).map("{:.3f}%".format), v.map("{:.4f}".format))
+
+    return display.sort_values("metric").reset_index(drop=True)
 
 
 def main():
@@ -258,7 +224,7 @@ def main():
     ap.add_argument("--experiment_id", type=str, default="exp_checkout_v1")
     args = ap.parse_args()
 
-    table = run_readout(args.db, args.experiment_id)
+    table = format_readout(run_readout(args.db, args.experiment_id))
     print("\n✅ LaunchLens A/B Readout (experiment period only)")
     print(table.to_string(index=False))
 
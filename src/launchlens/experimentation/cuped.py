@@ -20,25 +20,24 @@ from __future__ import annotations
 import argparse
 import math
 
-import duckdb
-import numpy as np
-import pandas as pd
-from scipy import stats
+from scipy.special import stdtr, stdtrit
 
+from launchlens.utils.db import connect
 
-def welch_ttest_ci(a: np.ndarray, b: np.ndarray) -> tuple[float, float, float, float]:
-    """Return (diff, ci_low, ci_high, p_value) for diff = mean(b)-mean(a)."""
-    a = a.astype(float)
-    b = b.astype(float)
 
-    diff = float(np.mean(b) - np.mean(a))
+def welch_ttest_ci(
+    mean_a: float, var_a: float, n_a: int, mean_b: float, var_b: float, n_b: int
+) -> tuple[float, float, float, float]:
+    """Return (diff, ci_low, ci_high, p_value) for diff = mean(b)-mean(a), from per-group moments."""
+    diff = float(mean_b - mean_a)
 
-    va = np.var(a, ddof=1)
-    vb = np.var(b, ddof=1)
-    na, nb = len(a), len(b)
-    se = math.sqrt(va / na + vb / nb)
+    va, vb = float(var_a), float(var_b)
+    na, nb = int(n_a), int(n_b)
+    if na < 2 or nb < 2:
+        return diff, diff, diff, 1.0
 
-    if se == 0 or na < 2 or nb < 2:
+    se = math.sqrt(va / na + vb / nb)
+    if se == 0:
         return diff, diff, diff, 1.0
 
     # Welch df
@@ -46,10 +45,10 @@ def welch_ttest_ci(a: np.ndarray, b: np.ndarray) -> tuple[float, float, float, f
     df_den = (va**2) / (na**2 * (na - 1)) + (vb**2) / (nb**2 * (nb - 1))
     df = df_num / df_den if df_den > 0 else (na + nb - 2)
 
-    tcrit = stats.t.ppf(0.975, df)
+    tcrit = stdtrit(df, 0.975)
     ci_low, ci_high = diff - tcrit * se, diff + tcrit * se
 
-    tstat, p_value = stats.ttest_ind(b, a, equal_var=False, nan_policy="omit")
+    p_value = 2 * stdtr(df, -abs(diff / se))
     return diff, float(ci_low), float(ci_high), float(p_value)
 
 
@@ -59,12 +58,13 @@ def main():
     ap.add_argument("--experiment_id", type=str, default="exp_checkout_v1")
     args = ap.parse_args()
 
-    con = duckdb.connect(args.db)
+    con = connect(args.db)
 
-    # Build user-level dataset:
+    # User-level dataset, reduced to moments inside DuckDB:
     # Y = total revenue during experiment period
     # X = pre_rev (pre-period covariate)
-    df = con.execute(
+    # One row per variant plus a pooled row (is_total) from the empty grouping set.
+    rows = con.execute(
         """
         WITH y AS (
           SELECT
@@ -75,51 +75,62 @@ def main():
           WHERE experiment_id = ?
             AND is_experiment_period = TRUE
           GROUP BY user_id
+        ),
+        yx AS (
+          SELECT
+            y.variant,
+            COALESCE(y.y_rev, 0.0) AS y_rev,
+            u.pre_rev AS x_pre_rev
+          FROM y
+          JOIN users u USING (user_id)
         )
         SELECT
-          y.user_id,
-          y.variant,
-          COALESCE(y.y_rev, 0.0) AS y_rev,
-          u.pre_rev AS x_pre_rev
-        FROM y
-        JOIN users u USING (user_id)
+          GROUPING(variant) = 1 AS is_total,
+          variant,
+          COUNT(*) AS n,
+          AVG(y_rev) AS y_mean,
+          COALESCE(VAR_SAMP(y_rev), 0.0) AS y_var,
+          AVG(x_pre_rev) AS x_mean,
+          COALESCE(VAR_SAMP(x_pre_rev), 0.0) AS x_var,
+          COALESCE(COVAR_SAMP(y_rev, x_pre_rev), 0.0) AS yx_cov
+        FROM yx
+        GROUP BY GROUPING SETS ((variant), ())
         """,
         [args.experiment_id],
-    ).fetchdf()
+    ).fetchall()
     con.close()
 
-    # CUPED theta = cov(Y, X)/var(X)
-    x = df["x_pre_rev"].to_numpy(dtype=float)
-    y = df["y_rev"].to_numpy(dtype=float)
-
-    x_mean = float(np.mean(x))
-    y_mean = float(np.mean(y))
+    # a NULL variant is a real group too, so key the pooled row on GROUPING() rather than on None
+    pooled = next(r[2:] for r in rows if r[0])
+    moments = {r[1]: r[2:] for r in rows if not r[0]}
+    n, _, var_y, x_mean, var_x, cov_yx = pooled
+    if n == 0:
+        raise SystemExit(f"❌ No experiment-period users for {args.experiment_id}.")
 
-    cov_yx = float(np.cov(y, x, ddof=1)[0, 1])
-    var_x = float(np.var(x, ddof=1))
+    # CUPED theta = cov(Y, X)/var(X)
     theta = cov_yx / var_x if var_x > 0 else 0.0
 
-    y_cuped = y - theta * (x - x_mean)
-    df["y_rev_cuped"] = y_cuped
-
-    # Split
-    c = df[df["variant"] == "control"]
-    t = df[df["variant"] == "treatment"]
+    # Y* = Y - theta * (X - mean(X)), per variant, without materializing Y*:
+    # mean(Y*) = mean(Y) - theta * (mean_v(X) - mean(X))
+    # var(Y*)  = var(Y) - 2 * theta * cov(Y, X) + theta^2 * var(X)
+    def raw_and_cuped(label: str) -> tuple[tuple[float, float, int], tuple[float, float, int]]:
+        n, y_m, y_v, x_m, x_v, c_yx = moments.get(label, (0, 0.0, 0.0, 0.0, 0.0, 0.0))
+        raw = (y_m or 0.0, y_v, n)
+        cup = ((y_m or 0.0) - theta * ((x_m or 0.0) - x_mean), y_v - 2 * theta * c_yx + theta**2 * x_v, n)
+        return raw, cup
 
-    raw_c = c["y_rev"].to_numpy()
-    raw_t = t["y_rev"].to_numpy()
-    cup_c = c["y_rev_cuped"].to_numpy()
-    cup_t = t["y_rev_cuped"].to_numpy()
+    raw_c, cup_c = raw_and_cuped("control")
+    raw_t, cup_t = raw_and_cuped("treatment")
 
     # Raw stats
-    raw_diff, raw_lo, raw_hi, raw_p = welch_ttest_ci(raw_c, raw_t)
+    raw_diff, raw_lo, raw_hi, raw_p = welch_ttest_ci(*raw_c, *raw_t)
 
     # CUPED stats
-    cup_diff, cup_lo, cup_hi, cup_p = welch_ttest_ci(cup_c, cup_t)
+    cup_diff, cup_lo, cup_hi, cup_p = welch_ttest_ci(*cup_c, *cup_t)
 
-    # Variance reduction (on overall variance of metric)
-    var_raw = float(np.var(y, ddof=1))
-    var_cup = float(np.var(y_cuped, ddof=1))
+    # Variance reduction (on overall variance of metric); var(Y*) = var(Y) - theta * cov(Y, X)
+    var_raw = var_y
+    var_cup = var_y - theta * cov_yx
     var_red = (1 - (var_cup / var_raw)) if var_raw > 0 else 0.0
 
     # Print report
@@ -130,13 +141,13 @@ def main():
     print(f"- Variance reduction: {var_red*100:.2f}%\n")
 
     print("RAW revenue_per_user (experiment period)")
-    print(f"  control mean:   {f(np.mean(raw_c))}")
-    print(f"  treatment mean: {f(np.mean(raw_t))}")
+    print(f"  control mean:   {f(raw_c[0])}")
+    print(f"  treatment mean: {f(raw_t[0])}")
     print(f"  diff (T-C):     {f(raw_diff)}   95% CI [{f(raw_lo)}, {f(raw_hi)}]   p={f(raw_p)}\n")
 
     print("CUPED-adjusted revenue_per_user")
-    print(f"  control mean:   {f(np.mean(cup_c))}")
-    print(f"  treatment mean: {f(np.mean(cup_t))}")
+    print(f"  control mean:   {f(cup_c[0])}")
+    print(f"  treatment mean: {f(cup_t[0])}")
     print(f"  diff (T-C):     {f(cup_diff)}   95% CI [{f(cup_lo)}, {f(cup_hi)}]   p={f(cup_p)}")
 
 
@@ -3,20 +3,15 @@ from __future__ import annotations
 import argparse
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
 import duckdb
 import numpy as np
 import pandas as pd
 from scipy import stats
 
-from launchlens.experimentation.ab_readout import run_readout
-
-
-def _get_count(df: pd.DataFrame, col: str, label: str) -> int:
-    sub = df[df["variant"] == label]
-    if sub.empty:
-        return 0
-    return int(sub[col].iloc[0])
+from launchlens.experimentation.ab_readout import format_readout, run_readout
+from launchlens.utils.db import connect
 
 
 def _srm_pval(nc: int, nt: int, expected_treat: float = 0.5) -> tuple[float, float]:
@@ -32,123 +27,135 @@ def _table_md(df: pd.DataFrame) -> str:
     return df.to_markdown(index=False)
 
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--db", type=str, default="data/launchlens.duckdb")
-    ap.add_argument("--experiment_id", type=str, default="exp_checkout_v1")
-    ap.add_argument("--expected_treatment_share", type=float, default=0.50)
-    ap.add_argument("--out_dir", type=str, default="artifacts/reports")
-    args = ap.parse_args()
-
-    out_dir = Path(args.out_dir)
+def generate_report(
+    db_path: str,
+    experiment_id: str,
+    out_dir: str = "artifacts/reports",
+    expected_treatment_share: float = 0.50,
+    con: Optional[duckdb.DuckDBPyConnection] = None,
+) -> Path:
+    """
+    Write the Markdown experiment report to out_dir and return its path.
+    Pass an open connection as con to reuse it; otherwise one is opened (read-only) and closed here.
+    """
+    out_dir = Path(out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    con = duckdb.connect(args.db)
-
-    # ---------- SRM ----------
-    users = con.execute(
-        """
-        SELECT variant, COUNT(*) AS n_users
-        FROM users
-        WHERE experiment_id = ?
-        GROUP BY 1
-        """,
-        [args.experiment_id],
-    ).fetchdf()
-
-    sessions = con.execute(
-        """
-        SELECT variant, COUNT(*) AS n_sessions
-        FROM fact_sessions
-        WHERE experiment_id = ?
-          AND is_experiment_period = TRUE
-        GROUP BY 1
-        """,
-        [args.experiment_id],
-    ).fetchdf()
-
-    u_c = _get_count(users, "n_users", "control")
-    u_t = _get_count(users, "n_users", "treatment")
-    s_c = _get_count(sessions, "n_sessions", "control")
-    s_t = _get_count(sessions, "n_sessions", "treatment")
-
-    chi_u, p_u = _srm_pval(u_c, u_t, args.expected_treatment_share)
-    chi_s, p_s = _srm_pval(s_c, s_t, args.expected_treatment_share)
-
-    # ---------- Guardrails (experiment period only) ----------
-    guard = con.execute(
-        """
-        SELECT
-          variant,
-          COUNT(*) AS sessions,
-          AVG(has_click)::DOUBLE AS click_rate,
-          AVG(has_add_to_cart)::DOUBLE AS atc_rate_per_session,
-          AVG(has_purchase)::DOUBLE AS purchase_rate_per_session,
-          AVG(revenue)::DOUBLE AS revenue_per_session,
-          (SUM(has_click)::DOUBLE / NULLIF(SUM(has_impression), 0)) AS ctr,
-          (SUM(has_add_to_cart)::DOUBLE / NULLIF(SUM(has_click), 0)) AS atc_rate_given_click
-        FROM fact_sessions
-        WHERE experiment_id = ?
-          AND is_experiment_period = TRUE
-        GROUP BY 1
-        ORDER BY 1
-        """,
-        [args.experiment_id],
-    ).fetchdf()
-
-    # ---------- Daily trend data (if available) ----------
-    cols = con.execute("PRAGMA table_info('daily_metrics')").fetchdf()["name"].tolist()
-    has_period_col = "is_experiment_period" in cols
-
-    if has_period_col:
-        daily = con.execute(
+    own_con = con is None
+    if own_con:
+        con = connect(db_path)
+
+    try:
+        # ---------- SRM ----------
+        # variant -> count
+        users = dict(con.execute(
             """
-            SELECT
-              event_date, variant, is_experiment_period,
-              sessions, purchase_rate_per_session, revenue_per_session, ctr, atc_rate
-            FROM daily_metrics
+            SELECT variant, COUNT(*) AS n_users
+            FROM users
             WHERE experiment_id = ?
-            ORDER BY event_date, variant
+            GROUP BY 1
             """,
-            [args.experiment_id],
-        ).fetchdf()
-    else:
-        # fallback: still pull trends without explicit flag
-        daily = con.execute(
+            [experiment_id],
+        ).fetchall())
+
+        sessions = dict(con.execute(
+            """
+            SELECT variant, COUNT(*) AS n_sessions
+            FROM fact_sessions
+            WHERE experiment_id = ?
+              AND is_experiment_period = TRUE
+            GROUP BY 1
+            """,
+            [experiment_id],
+        ).fetchall())
+
+        u_c = users.get("control", 0)
+        u_t = users.get("treatment", 0)
+        s_c = sessions.get("control", 0)
+        s_t = sessions.get("treatment", 0)
+
+        chi_u, p_u = _srm_pval(u_c, u_t, expected_treatment_share)
+        chi_s, p_s = _srm_pval(s_c, s_t, expected_treatment_share)
+
+        # ---------- Guardrails (experiment period only) ----------
+        guard = con.execute(
             """
             SELECT
-              event_date, variant,
-              sessions, purchase_rate_per_session, revenue_per_session, ctr, atc_rate
-            FROM daily_metrics
+              variant,
+              COUNT(*) AS sessions,
+              AVG(has_click)::DOUBLE AS click_rate,
+              AVG(has_add_to_cart)::DOUBLE AS atc_rate_per_session,
+              AVG(has_purchase)::DOUBLE AS purchase_rate_per_session,
+              AVG(revenue)::DOUBLE AS revenue_per_session,
+              (SUM(has_click)::DOUBLE / NULLIF(SUM(has_impression), 0)) AS ctr,
+              (SUM(has_add_to_cart)::DOUBLE / NULLIF(SUM(has_click), 0)) AS atc_rate_given_click
+            FROM fact_sessions
             WHERE experiment_id = ?
-            ORDER BY event_date, variant
+              AND is_experiment_period = TRUE
+            GROUP BY 1
+            ORDER BY 1
             """,
-            [args.experiment_id],
+            [experiment_id],
         ).fetchdf()
 
-    con.close()
-
-    # ---------- A/B Readout (formatted table) ----------
-    readout = run_readout(args.db, args.experiment_id)
+        # ---------- Daily trend data (if available) ----------
+        # table_info rows are (cid, name, type, notnull, dflt_value, pk); only the names are needed
+        cols = {row[1] for row in con.execute("PRAGMA table_info('daily_metrics')").fetchall()}
+        has_period_col = "is_experiment_period" in cols
+        # newer warehouses also hold per-period rollups in daily_metrics; keep only the daily rows
+        day_filter = "AND grain = 'day'" if "grain" in cols else ""
+
+        if has_period_col:
+            daily = con.execute(
+                f"""
+                SELECT
+                  CAST(event_date AS TIMESTAMP) AS event_date, variant, is_experiment_period,
+                  sessions, purchase_rate_per_session, revenue_per_session, ctr, atc_rate
+                FROM daily_metrics
+                WHERE experiment_id = ?
+                  {day_filter}
+                ORDER BY event_date, variant
+                """,
+                [experiment_id],
+            ).to_arrow_table().to_pandas(types_mapper=pd.ArrowDtype)
+        else:
+            # fallback: still pull trends without explicit flag
+            daily = con.execute(
+                f"""
+                SELECT
+                  CAST(event_date AS TIMESTAMP) AS event_date, variant,
+                  sessions, purchase_rate_per_session, revenue_per_session, ctr, atc_rate
+                FROM daily_metrics
+                WHERE experiment_id = ?
+                  {day_filter}
+                ORDER BY event_date, variant
+                """,
+                [experiment_id],
+            ).to_arrow_table().to_pandas(types_mapper=pd.ArrowDtype)
+
+        # ---------- A/B Readout (formatted table) ----------
+        readout = run_readout(db_path, experiment_id, con=con)
+    finally:
+        if own_con:
+            con.close()
+
+    readout_display = format_readout(readout)
 
     # Decision rule (same as dashboard)
     primary = readout[readout["metric"] == "purchase_rate_per_session"].iloc[0]
-    pval_primary = float(primary["p_value"])
-    abs_diff_num = float(str(primary["abs_diff"]).replace("%", "")) / 100.0
-    ship = (pval_primary < 0.05) and (abs_diff_num > 0)
+    ship = (float(primary["p_value"]) < 0.05) and (float(primary["abs_diff"]) > 0)
+    primary_display = readout_display[readout_display["metric"] == "purchase_rate_per_session"].iloc[0]
 
     # Trend summary (simple)
     trend_notes = ""
     if daily is not None and not daily.empty:
-        daily["event_date"] = pd.to_datetime(daily["event_date"])
-        last7 = daily[daily["event_date"] >= (daily["event_date"].max() - pd.Timedelta(days=6))].copy()
+        last7 = daily[daily["event_date"] >= (daily["event_date"].max() - pd.Timedelta(days=6))]
         if not last7.empty:
-            piv = last7.pivot_table(
-                index="event_date", columns="variant", values="purchase_rate_per_session", aggfunc="mean"
-            )
-            if "control" in piv.columns and "treatment" in piv.columns:
-                avg_c = float(piv["control"].mean())
-                avg_t = float(piv["treatment"].mean())
+            # mean over the last 7 daily rows per variant (daily only holds grain = 'day' rows)
+            avg = last7.groupby("variant")["purchase_rate_per_session"].mean()
+            if "control" in avg.index and "treatment" in avg.index:
+                avg_c = float(avg["control"])
+                avg_t = float(avg["treatment"])
                 trend_notes = (
                     f"- Last 7 days avg purchase/session: control={avg_c:.4%}, "
                     f"treatment={avg_t:.4%} (Δ={avg_t-avg_c:.4%})"
@@ -162,9 +169,9 @@ def main():
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     report_md = f"""# LaunchLens Experiment Report
 
-**Experiment:** `{args.experiment_id}`  
+**Experiment:** `{experiment_id}`  
 **Generated:** {now}  
-**Data source:** `{args.db}`  
+**Data source:** `{db_path}`  
 
 ---
 
@@ -172,9 +179,9 @@ def main():
 
 **Recommendation:** {"✅ Ship" if ship else "⚠️ Hold / Continue Experiment"}  
 **Primary metric:** `purchase_rate_per_session`  
-- Δ (T-C): {primary["abs_diff"]}  
-- 95% CI: [{primary["ci_low"]}, {primary["ci_high"]}]  
-- p-value: {primary["p_value"]}
+- Δ (T-C): {primary_display["abs_diff"]}  
+- 95% CI: [{primary_display["ci_low"]}, {primary_display["ci_high"]}]  
+- p-value: {primary_display["p_value"]}
 
 ---
 
@@ -194,7 +201,7 @@ def main():
 
 ## A/B Readout (Experiment Period)
 
-{_table_md(readout)}
+{_table_md(readout_display)}
 
 ---
 
@@ -210,9 +217,20 @@ def main():
 {daily_preview}
 """
 
-    out_path = out_dir / f"{args.experiment_id}_report.md"
+    out_path = out_dir / f"{experiment_id}_report.md"
     out_path.write_text(report_md, encoding="utf-8")
+    return out_path
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", type=str, default="data/launchlens.duckdb")
+    ap.add_argument("--experiment_id", type=str, default="exp_checkout_v1")
+    ap.add_argument("--expected_treatment_share", type=float, default=0.50)
+    ap.add_argument("--out_dir", type=str, default="artifacts/reports")
+    args = ap.parse_args()
 
+    out_path = generate_report(args.db, args.experiment_id, args.out_dir, args.expected_treatment_share)
     print(f"✅ Report written: {out_path}")
 
 
@@ -13,12 +13,10 @@ Guardrails:
 from __future__ import annotations
 
 import argparse
+import math
 from dataclasses import dataclass
 
-import duckdb
-import numpy as np
-import pandas as pd
-from scipy import stats
+from launchlens.utils.db import connect
 
 
 @dataclass
@@ -36,10 +34,12 @@ def srm_test(n_control: int, n_treatment: int, expected_share_treatment: float)
     exp_t = total * expected_share_treatment
     exp_c = total * (1.0 - expected_share_treatment)
 
-    observed = np.array([n_control, n_treatment], dtype=float)
-    expected = np.array([exp_c, exp_t], dtype=float)
-
-    chi2, p = stats.chisquare(f_obs=observed, f_exp=expected)
+    # 2-cell chi-square (1 dof): p = erfc(sqrt(chi2 / 2))
+    if total == 0:
+        chi2, p = 0.0, 1.0
+    else:
+        chi2 = (n_control - exp_c) ** 2 / exp_c + (n_treatment - exp_t) ** 2 / exp_t
+        p = math.erfc(math.sqrt(chi2 / 2.0))
     return SRMResult(
         level="count",
         n_control=int(n_control),
@@ -57,68 +57,45 @@ def main():
     ap.add_argument("--expected_treatment_share", type=float, default=0.50)
     args = ap.parse_args()
 
-    con = duckdb.connect(args.db)
-
-    # SRM at USER level (recommended)
-    users = con.execute(
-        """
-        SELECT variant, COUNT(*) AS n_users
-        FROM users
-        WHERE experiment_id = ?
-        GROUP BY 1
-        """,
-        [args.experiment_id],
-    ).fetchdf()
-
-    # SRM at SESSION level (also useful)
-    sessions = con.execute(
-        """
-        SELECT variant, COUNT(*) AS n_sessions
-        FROM fact_sessions
-        WHERE experiment_id = ?
-          AND is_experiment_period = TRUE
-        GROUP BY 1
-        """,
-        [args.experiment_id],
-    ).fetchdf()
-
-    # Guardrail rollup (experiment period only)
-    guard = con.execute(
+    con = connect(args.db)
+
+    # SRM counts at USER level (recommended) and SESSION level (also useful),
+    # pre-aggregated by the warehouse build into mv_experiment_summary
+    counts = {
+        (level, variant): n
+        for level, variant, n in con.execute(
+            "SELECT level, variant, n FROM mv_experiment_summary WHERE experiment_id = ?",
+            [args.experiment_id],
+        ).fetchall()
+    }
+    u_c = counts.get(("user", "control"), 0)
+    u_t = counts.get(("user", "treatment"), 0)
+    s_c = counts.get(("session", "control"), 0)
+    s_t = counts.get(("session", "treatment"), 0)
+
+    # Guardrail rollup (experiment period only), from the grain='period' rows of daily_metrics
+    guard = con.sql(
         """
         SELECT
           variant,
-          COUNT(*) AS sessions,
-          AVG(has_impression)::DOUBLE AS impression_rate,
-          AVG(has_click)::DOUBLE AS click_rate,
-          AVG(has_add_to_cart)::DOUBLE AS atc_rate_per_session,
-          AVG(has_purchase)::DOUBLE AS purchase_rate_per_session,
-          AVG(revenue)::DOUBLE AS revenue_per_session,
+          sessions,
+          sessions_with_impression::DOUBLE / sessions AS impression_rate,
+          sessions_with_click::DOUBLE / sessions AS click_rate,
+          sessions_with_add_to_cart::DOUBLE / sessions AS atc_rate_per_session,
+          purchase_rate_per_session,
+          revenue_per_session,
           -- CTR among impression sessions
-          (SUM(has_click)::DOUBLE / NULLIF(SUM(has_impression), 0)) AS ctr,
+          (sessions_with_click::DOUBLE / NULLIF(sessions_with_impression, 0)) AS ctr,
           -- ATC rate among click sessions
-          (SUM(has_add_to_cart)::DOUBLE / NULLIF(SUM(has_click), 0)) AS atc_rate_given_click
-        FROM fact_sessions
-        WHERE experiment_id = ?
-          AND is_experiment_period = TRUE
-        GROUP BY 1
+          (sessions_with_add_to_cart::DOUBLE / NULLIF(sessions_with_click, 0)) AS atc_rate_given_click
+        FROM daily_metrics
+        WHERE grain = 'period'
+          AND experiment_id = ?
+          AND is_experiment_period = 1
         ORDER BY 1
         """,
-        [args.experiment_id],
-    ).fetchdf()
-
-    con.close()
-
-    # SRM calc helpers
-    def get_count(df: pd.DataFrame, col: str, label: str) -> int:
-        sub = df[df["variant"] == label]
-        if sub.empty:
-            return 0
-        return int(sub[col].iloc[0])
-
-    u_c = get_count(users, "n_users", "control")
-    u_t = get_count(users, "n_users", "treatment")
-    s_c = get_count(sessions, "n_sessions", "control")
-    s_t = get_count(sessions, "n_sessions", "treatment")
+        params=[args.experiment_id],
+    )
 
     user_srm = srm_test(u_c, u_t, args.expected_treatment_share)
     sess_srm = srm_test(s_c, s_t, args.expected_treatment_share)
@@ -136,8 +113,8 @@ def main():
     print("  FLAG:" + (" ✅ OK (no SRM)" if sess_srm.p_value >= 0.01 else " ❌ SRM detected (p<0.01)"))
 
     print("\nGuardrail metrics (experiment period)")
-    pd.set_option("display.max_columns", None)
-    print(guard.to_string(index=False))
+    guard.show(max_width=10_000)
+    con.close()
 
 
 if __name__ == "__main__":
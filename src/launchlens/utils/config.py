@@ -1,14 +1,25 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict
 
 import yaml
 
 
+# libyaml's C loader when PyYAML was built with it, else the pure-Python one
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+@lru_cache(maxsize=None)
+def _load_resolved(path: Path) -> Dict[str, Any]:
+    if not path.exists():
+        raise FileNotFoundError(f"Config not found: {path}")
+    # bytes go straight to the loader, which does its own decoding
+    return yaml.load(path.read_bytes(), Loader=_Loader)
+
+
 def load_config(path: str = "config.yaml") -> Dict[str, Any]:
-    p = Path(path)
-    if not p.exists():
-        raise FileNotFoundError(f"Config not found: {p.resolve()}")
-    return yaml.safe_load(p.read_text(encoding="utf-8"))
+    # parsed once per absolute path; treat the returned dict as read-only
+    return _load_resolved(Path(path).resolve())
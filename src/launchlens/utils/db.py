@@ -0,0 +1,11 @@
+from __future__ import annotations
+
+import os
+
+import duckdb
+
+
+def connect(db_path: str, read_only: bool = True) -> duckdb.DuckDBPyConnection:
+    # DuckDB refuses a second connection to the same file with a different config,
+    # so every in-process reader should open through here.
+    return duckdb.connect(db_path, read_only=read_only, config={"threads": os.cpu_count() or 1})
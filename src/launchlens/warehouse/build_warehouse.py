@@ -7,14 +7,16 @@ Inputs:
 Creates:
 - fact_sessions: session-level fact table (one row per user-session)
 - fact_sessions_daily: session-level with derived event_date
-- daily_metrics: variant/day rollups (funnel + revenue)
+- daily_metrics: variant/day rollups (funnel + revenue), plus variant/period rollups (grain column)
+- mv_experiment_summary: SRM unit counts per experiment/variant (users; experiment-period sessions)
 - dq_checks: basic data quality checks + pass/fail flags
 """
 
 from __future__ import annotations
 
 import argparse
-import duckdb
+
+from launchlens.utils.db import connect
 
 
 WAREHOUSE_SQL = r"""
@@ -33,7 +35,7 @@ SELECT
   revenue::DOUBLE AS revenue
 FROM events;
 
--- Session-level funnel flags
+-- Session-level funnel flags (BOOL_OR per session, stored as 0/1 INTEGER for downstream SUM/AVG)
 CREATE OR REPLACE TABLE fact_sessions AS
 WITH sess AS (
   SELECT
@@ -44,71 +46,107 @@ WITH sess AS (
     ANY_VALUE(experiment_id) AS experiment_id,
     ANY_VALUE(variant) AS variant,
     BOOL_OR(is_experiment_period) AS is_experiment_period,
-    MAX(CASE WHEN event_type = 'impression' THEN 1 ELSE 0 END) AS has_impression,
-    MAX(CASE WHEN event_type = 'click' THEN 1 ELSE 0 END) AS has_click,
-    MAX(CASE WHEN event_type = 'add_to_cart' THEN 1 ELSE 0 END) AS has_add_to_cart,
-    MAX(CASE WHEN event_type = 'purchase' THEN 1 ELSE 0 END) AS has_purchase,
+    COALESCE(BOOL_OR(event_type = 'impression'), FALSE)::INTEGER AS has_impression,
+    COALESCE(BOOL_OR(event_type = 'click'), FALSE)::INTEGER AS has_click,
+    COALESCE(BOOL_OR(event_type = 'add_to_cart'), FALSE)::INTEGER AS has_add_to_cart,
+    COALESCE(BOOL_OR(event_type = 'purchase'), FALSE)::INTEGER AS has_purchase,
     SUM(CASE WHEN event_type = 'purchase' THEN revenue ELSE 0 END) AS revenue
   FROM v_events
   GROUP BY user_id, session_id
 )
-SELECT * FROM sess;
-
--- Daily rollups per variant
-CREATE OR REPLACE TABLE daily_metrics AS
 SELECT
+  user_id,
+  session_id,
+  session_start_time,
   event_date,
   experiment_id,
   variant,
-  MAX(CASE WHEN is_experiment_period THEN 1 ELSE 0 END) AS is_experiment_period,
-  COUNT(*) AS sessions,
-  SUM(has_impression) AS sessions_with_impression,
-  SUM(has_click) AS sessions_with_click,
-  SUM(has_add_to_cart) AS sessions_with_add_to_cart,
-  SUM(has_purchase) AS sessions_with_purchase,
-  SUM(revenue) AS revenue,
+  is_experiment_period,
+  has_impression,
+  has_click,
+  has_add_to_cart,
+  has_purchase,
+  revenue
+FROM sess
+-- cluster row groups on the usual filter columns so min/max zone maps can prune;
+-- experiment-period sessions first so the monitoring filter skips whole row groups
+ORDER BY is_experiment_period DESC, experiment_id, variant, event_date;
+
+-- Rollups per variant, two grains written in one pass over fact_sessions:
+--   grain = 'day'    -> one row per (event_date, experiment_id, variant)
+--   grain = 'period' -> one row per (experiment_id, variant, is_experiment_period); event_date is NULL
+CREATE OR REPLACE TABLE daily_metrics AS
+WITH agg AS (
+  SELECT
+    CASE WHEN GROUPING(event_date) = 0 THEN 'day' ELSE 'period' END AS grain,
+    event_date,
+    experiment_id,
+    variant,
+    MAX(CASE WHEN is_experiment_period THEN 1 ELSE 0 END) AS is_experiment_period,
+    COUNT(*) AS sessions,
+    COUNT(*) FILTER (WHERE has_impression = 1) AS sessions_with_impression,
+    COUNT(*) FILTER (WHERE has_click = 1) AS sessions_with_click,
+    COUNT(*) FILTER (WHERE has_add_to_cart = 1) AS sessions_with_add_to_cart,
+    COUNT(*) FILTER (WHERE has_purchase = 1) AS sessions_with_purchase,
+    SUM(revenue) AS revenue
+  FROM fact_sessions
+  GROUP BY GROUPING SETS (
+    (event_date, experiment_id, variant),
+    (experiment_id, variant, is_experiment_period)
+  )
+)
+SELECT
+  *,
   -- Key rates (avoid div0)
-  CASE WHEN SUM(has_impression) = 0 THEN 0
-       ELSE SUM(has_click)::DOUBLE / SUM(has_impression) END AS ctr,
-  CASE WHEN SUM(has_click) = 0 THEN 0
-       ELSE SUM(has_add_to_cart)::DOUBLE / SUM(has_click) END AS atc_rate,
-  CASE WHEN SUM(has_add_to_cart) = 0 THEN 0
-       ELSE SUM(has_purchase)::DOUBLE / SUM(has_add_to_cart) END AS purchase_rate_given_atc,
-  CASE WHEN COUNT(*) = 0 THEN 0
-       ELSE SUM(has_purchase)::DOUBLE / COUNT(*) END AS purchase_rate_per_session,
-  CASE WHEN COUNT(*) = 0 THEN 0
-       ELSE SUM(revenue)::DOUBLE / COUNT(*) END AS revenue_per_session
-FROM fact_sessions
-GROUP BY event_date, experiment_id, variant
-ORDER BY event_date, variant;
-
--- Data quality checks
+  CASE WHEN sessions_with_impression = 0 THEN 0
+       ELSE sessions_with_click::DOUBLE / sessions_with_impression END AS ctr,
+  CASE WHEN sessions_with_click = 0 THEN 0
+       ELSE sessions_with_add_to_cart::DOUBLE / sessions_with_click END AS atc_rate,
+  CASE WHEN sessions_with_add_to_cart = 0 THEN 0
+       ELSE sessions_with_purchase::DOUBLE / sessions_with_add_to_cart END AS purchase_rate_given_atc,
+  CASE WHEN sessions = 0 THEN 0
+       ELSE sessions_with_purchase::DOUBLE / sessions END AS purchase_rate_per_session,
+  CASE WHEN sessions = 0 THEN 0
+       ELSE revenue / sessions END AS revenue_per_session
+FROM agg
+ORDER BY grain, event_date, is_experiment_period, variant;
+
+-- SRM unit counts, so monitoring reads a few rows instead of aggregating users/fact_sessions:
+--   level = 'user'    -> assigned users per variant
+--   level = 'session' -> experiment-period sessions per variant (from the period rollup above)
+CREATE OR REPLACE TABLE mv_experiment_summary AS
+SELECT experiment_id, variant, 'user' AS level, COUNT(*) AS n
+FROM users
+GROUP BY experiment_id, variant
+UNION ALL
+SELECT experiment_id, variant, 'session' AS level, sessions AS n
+FROM daily_metrics
+WHERE grain = 'period'
+  AND is_experiment_period = 1
+ORDER BY experiment_id, level, variant;
+
+-- Data quality checks (one scan of events, one of users; pass derived from the same observed value)
 CREATE OR REPLACE TABLE dq_checks AS
-WITH checks AS (
-  SELECT 'events_nonempty' AS check_name,
-         (SELECT COUNT(*) FROM events) AS observed,
-         1 AS threshold_min,
-         CASE WHEN (SELECT COUNT(*) FROM events) >= 1 THEN TRUE ELSE FALSE END AS pass
-  UNION ALL
-  SELECT 'users_nonempty',
-         (SELECT COUNT(*) FROM users),
-         1,
-         CASE WHEN (SELECT COUNT(*) FROM users) >= 1 THEN TRUE ELSE FALSE END
-  UNION ALL
-  SELECT 'no_null_user_ids_events',
-         (SELECT COUNT(*) FROM events WHERE user_id IS NULL),
-         0,
-         CASE WHEN (SELECT COUNT(*) FROM events WHERE user_id IS NULL) = 0 THEN TRUE ELSE FALSE END
-  UNION ALL
-  SELECT 'no_null_session_ids_events',
-         (SELECT COUNT(*) FROM events WHERE session_id IS NULL),
-         0,
-         CASE WHEN (SELECT COUNT(*) FROM events WHERE session_id IS NULL) = 0 THEN TRUE ELSE FALSE END
-  UNION ALL
-  SELECT 'valid_event_types',
-         (SELECT COUNT(*) FROM events WHERE event_type NOT IN ('impression','click','add_to_cart','purchase')),
-         0,
-         CASE WHEN (SELECT COUNT(*) FROM events WHERE event_type NOT IN ('impression','click','add_to_cart','purchase')) = 0 THEN TRUE ELSE FALSE END
+WITH e AS (
+  SELECT
+    COUNT(*) AS n_events,
+    COUNT(*) FILTER (WHERE user_id IS NULL) AS n_null_user_ids,
+    COUNT(*) FILTER (WHERE session_id IS NULL) AS n_null_session_ids,
+    COUNT(*) FILTER (WHERE event_type NOT IN ('impression','click','add_to_cart','purchase')) AS n_invalid_event_types
+  FROM events
+),
+u AS (
+  SELECT COUNT(*) AS n_users FROM users
+),
+checks AS (
+  SELECT c.*
+  FROM e, u, LATERAL (VALUES
+    ('events_nonempty', e.n_events, 1, e.n_events >= 1),
+    ('users_nonempty', u.n_users, 1, u.n_users >= 1),
+    ('no_null_user_ids_events', e.n_null_user_ids, 0, e.n_null_user_ids = 0),
+    ('no_null_session_ids_events', e.n_null_session_ids, 0, e.n_null_session_ids = 0),
+    ('valid_event_types', e.n_invalid_event_types, 0, e.n_invalid_event_types = 0)
+  ) AS c(check_name, observed, threshold_min, pass)
 )
 SELECT * FROM checks;
 """
@@ -119,25 +157,26 @@ def main():
     ap.add_argument("--db", type=str, default="data/launchlens.duckdb")
     args = ap.parse_args()
 
-    con = duckdb.connect(args.db)
+    con = connect(args.db, read_only=False)
     con.execute(WAREHOUSE_SQL)
 
     # Print summaries
-    dm = con.execute(
+    dm = con.sql(
         "SELECT variant, SUM(sessions) AS sessions, SUM(sessions_with_purchase) AS purchases, SUM(revenue) AS revenue "
-        "FROM daily_metrics GROUP BY 1 ORDER BY 1"
-    ).fetchdf()
-
-    dq = con.execute("SELECT * FROM dq_checks ORDER BY check_name").fetchdf()
-    con.close()
+        "FROM daily_metrics WHERE grain = 'day' GROUP BY 1 ORDER BY 1"
+    )
+    dq = con.sql("SELECT * FROM dq_checks ORDER BY check_name")
 
-    print("✅ Warehouse built: fact_sessions, daily_metrics, dq_checks")
+    print("✅ Warehouse built: fact_sessions, daily_metrics, mv_experiment_summary, dq_checks")
     print("\nDaily totals by variant:")
-    print(dm.to_string(index=False))
+    dm.show(max_width=10_000)
     print("\nDQ checks:")
-    print(dq.to_string(index=False))
+    dq.show(max_width=10_000)
+
+    dq_pass = con.execute("SELECT BOOL_AND(pass) FROM dq_checks").fetchone()[0]
+    con.close()
 
-    if not dq["pass"].all():
+    if not dq_pass:
         raise SystemExit("❌ Data quality checks failed. Fix before proceeding.")
 
 
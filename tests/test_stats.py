@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from launchlens.experimentation.ab_readout import (
+    _two_proportion_ztest,
+    _two_sample_ttest,
+    format_readout,
+)
+from launchlens.monitoring.srm_guardrails import srm_test
+
+
+def test_two_proportion_ztest_matches_normal_reference():
+    x1, n1, x2, n2 = np.array([120, 30]), np.array([4000, 900]), np.array([150, 31]), np.array([3900, 880])
+    _, _, diff, ci_low, ci_high, p_value = _two_proportion_ztest(x1, n1, x2, n2)
+
+    r1, r2 = x1 / n1, x2 / n2
+    se_ci = np.sqrt(r1 * (1 - r1) / n1 + r2 * (1 - r2) / n2)
+    pool = (x1 + x2) / (n1 + n2)
+    z = (r2 - r1) / np.sqrt(pool * (1 - pool) * (1 / n1 + 1 / n2))
+    zcrit = stats.norm.ppf(0.975)
+
+    np.testing.assert_allclose(diff, r2 - r1)
+    np.testing.assert_allclose(ci_low, r2 - r1 - zcrit * se_ci)
+    np.testing.assert_allclose(ci_high, r2 - r1 + zcrit * se_ci)
+    np.testing.assert_allclose(p_value, 2 * stats.norm.sf(np.abs(z)))
+
+
+def test_two_proportion_ztest_degenerate_inputs():
+    # empty arm (n == 0) and no variance (se == 0) both give p = 1 without warnings
+    with np.errstate(all="raise"):
+        p1, _, diff, ci_low, ci_high, p_value = _two_proportion_ztest([0, 0], [0, 50], [5, 0], [10, 40])
+    np.testing.assert_array_equal(p1, [0.0, 0.0])
+    np.testing.assert_array_equal(diff, [0.0, 0.0])
+    np.testing.assert_array_equal(ci_low, ci_high)
+    np.testing.assert_array_equal(p_value, [1.0, 1.0])
+
+
+def test_two_sample_ttest_matches_welch():
+    rng = np.random.default_rng(7)
+    a = rng.exponential(1.7, size=300)
+    b = rng.exponential(1.9, size=250)
+
+    diff, (ci_low, ci_high), p_value = _two_sample_ttest(
+        a.mean(), a.var(ddof=1), a.size, b.mean(), b.var(ddof=1), b.size
+    )
+    ref = stats.ttest_ind(b, a, equal_var=False)
+    ci = ref.confidence_interval(0.95)
+
+    assert diff == pytest.approx(b.mean() - a.mean())
+    assert p_value == pytest.approx(ref.pvalue)
+    assert (ci_low, ci_high) == pytest.approx((ci.low, ci.high))
+
+
+def test_two_sample_ttest_degenerate_inputs():
+    assert _two_sample_ttest(1.0, 0.5, 1, 2.0, 0.5, 10) == (0.0, (0.0, 0.0), 1.0)
+    assert _two_sample_ttest(1.0, 0.0, 10, 1.5, 0.0, 10) == (0.5, (0.5, 0.5), 1.0)
+
+
+@pytest.mark.parametrize("n_c, n_t, share", [(4043, 3957, 0.5), (8202, 7833, 0.5), (700, 300, 0.3)])
+def test_srm_test_matches_chisquare(n_c, n_t, share):
+    total = n_c + n_t
+    ref = stats.chisquare([n_c, n_t], f_exp=[total * (1 - share), total * share])
+
+    res = srm_test(n_c, n_t, share)
+    assert res.chi2 == pytest.approx(ref.statistic)
+    assert res.p_value == pytest.approx(ref.pvalue)
+
+
+def test_srm_test_empty():
+    res = srm_test(0, 0, 0.5)
+    assert (res.chi2, res.p_value) == (0.0, 1.0)
+
+
+def test_format_readout():
+    res = pd.DataFrame(
+        {
+            "metric": ["revenue_per_session", "ctr"],
+            "control": [1.72243, 0.30699],
+            "treatment": [1.85720, 0.29541],
+            "abs_diff": [0.13477, -0.01158],
+            "rel_diff": [0.07824, np.nan],
+            "ci_low": [-0.1, -0.02],
+            "ci_high": [0.37, -0.0015],
+            "p_value": [0.26, 0.0301],
+        }
+    )
+    out = format_readout(res)
+
+    assert out["metric"].tolist() == ["ctr", "revenue_per_session"]
+    assert out.iloc[0].tolist() == ["ctr", "30.699%", "29.541%", "-1.158%", "NA", "-2.000%", "-0.150%", "0.0301"]
+    assert out.iloc[1].tolist() == [
+        "revenue_per_session", "1.7224", "1.8572", "0.1348", "7.82%", "-0.1000", "0.3700", "0.2600"
+    ]